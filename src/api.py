@@ -6,17 +6,36 @@ Now with ChromaDB vector search + OpenAI RAG!
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
-import json
-import shutil
+import pyarrow.parquet as pq
+import asyncio
+import uuid
+import orjson
+import aiofiles
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 # Import enhanced pipeline modules
-from pipeline_v2 import run_pipeline, answer_question_with_rag, get_collection
+from pipeline_v2 import (
+    chunk_documents, store_chunks, answer_question_with_rag, answer_question_with_rag_stream,
+    get_collection, remove_document, rebuild_legacy_collection, warm_up, INDEX_FILENAME
+)
+from loader import load_documents
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm the retriever and OpenAI connection at startup,
+    so the first request doesn't pay for it
+    """
+    await asyncio.to_thread(warm_up, "ingested_docs")
+    yield
+
 
-app = FastAPI(title="GenAI Document API")
+app = FastAPI(title="GenAI Document API", lifespan=lifespan)
 
 # Enable CORS for Streamlit frontend
 app.add_middleware(
@@ -33,6 +52,20 @@ DATA_PROCESSED = Path(__file__).parent.parent / "data" / "processed"
 DATA_RAW.mkdir(parents=True, exist_ok=True)
 DATA_PROCESSED.mkdir(parents=True, exist_ok=True)
 
+# Size of each read when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# File types the parser handles (see loader.py)
+SUPPORTED_EXTENSIONS = {'.pdf', '.docx', '.txt'}
+
+# Background ingestion jobs: job_id -> asyncio.Task running the pipeline
+# (insertion ordered: oldest first)
+ingestion_jobs: Dict[str, asyncio.Task] = {}
+job_filenames: Dict[str, str] = {}
+
+# Finished jobs kept for /status; older ones are forgotten
+MAX_FINISHED_JOBS = 1000
+
 
 class QueryRequest(BaseModel):
     """Request model for document queries"""
@@ -56,31 +89,88 @@ async def root():
     }
 
 
+async def run_ingestion_job(file_path: Path):
+    """
+    Ingest an uploaded file; each stage runs in a worker thread
+    so the event loop keeps serving other requests
+    """
+    # A legacy collection is recreated empty: re-ingest every document
+    documents = [file_path]
+    if await asyncio.to_thread(rebuild_legacy_collection, "ingested_docs", str(DATA_PROCESSED)):
+        documents = await asyncio.to_thread(load_documents, str(DATA_RAW))
+    
+    # CPU stage: parse + chunk
+    chunks = await asyncio.to_thread(chunk_documents, documents, str(DATA_PROCESSED))
+    
+    # Parse errors are only logged: fail the job rather than store nothing
+    # (which would also drop the chunks of a previous upload of the file)
+    if file_path.name not in set(chunks.source_files):
+        raise ValueError(f"No text could be extracted from {file_path.name}")
+    
+    # I/O stage: embed + store in ChromaDB
+    await asyncio.to_thread(
+        store_chunks,
+        chunks,
+        documents,
+        output_dir=str(DATA_PROCESSED),
+        collection_name="ingested_docs"
+    )
+
+
+def log_job_result(job_id: str, filename: str, task: asyncio.Task):
+    """
+    Done-callback of ingestion jobs: log failures, so they are visible
+    (and retrieved) even if /status is never polled
+    """
+    if task.cancelled():
+        print(f"⚠️ Ingestion of {filename} cancelled (job {job_id})")
+    elif task.exception():
+        print(f"❌ Ingestion of {filename} failed (job {job_id}): {str(task.exception())}")
+
+
+def prune_jobs():
+    """
+    Forget the oldest finished jobs beyond MAX_FINISHED_JOBS
+    """
+    finished = [job_id for job_id, task in ingestion_jobs.items() if task.done()]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del ingestion_jobs[job_id]
+        job_filenames.pop(job_id, None)
+
+
 @app.post("/upload")
 async def upload_document(file: UploadFile = File(...)):
     """
     Upload a document to the system
-    Saves to data/raw/ directory
+    Saves to data/raw/ directory, then processes it in the background
+    Poll /status/{job_id} to know when it is searchable
     """
+    extension = Path(file.filename).suffix.lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {extension}")
+    
     try:
-        # Save uploaded file
+        # Stream uploaded file to disk without blocking the event loop
         file_path = DATA_RAW / file.filename
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
         
         # Trigger enhanced pipeline to process the new document
         # This will chunk, embed, and store in ChromaDB
-        collection = run_pipeline(
-            input_dir=str(DATA_RAW),
-            output_dir=str(DATA_PROCESSED),
-            collection_name="ingested_docs"
-        )
+        prune_jobs()
+        job_id = uuid.uuid4().hex
+        task = asyncio.create_task(run_ingestion_job(file_path))
+        task.add_done_callback(lambda t: log_job_result(job_id, file.filename, t))
+        ingestion_jobs[job_id] = task
+        job_filenames[job_id] = file.filename
         
         return {
-            "status": "success",
+            "status": "processing",
+            "job_id": job_id,
             "filename": file.filename,
-            "message": "Document uploaded, processed, and embedded in vector DB",
+            "message": "Document uploaded, processing and embedding in vector DB",
             "collection": "ingested_docs"
         }
     
@@ -88,6 +178,32 @@ async def upload_document(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@app.get("/status/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Get the status of a background ingestion job
+    """
+    task = ingestion_jobs.get(job_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if not task.done():
+        status, error = "processing", None
+    elif task.cancelled():
+        status, error = "cancelled", None
+    elif task.exception():
+        status, error = "failed", str(task.exception())
+    else:
+        status, error = "success", None
+    
+    return {
+        "job_id": job_id,
+        "filename": job_filenames.get(job_id),
+        "status": status,
+        "error": error
+    }
+
+
 @app.post("/query")
 async def query_documents(request: QueryRequest) -> QueryResponse:
     """
@@ -96,7 +212,9 @@ async def query_documents(request: QueryRequest) -> QueryResponse:
     """
     try:
         # Use enhanced RAG pipeline with vector search + OpenAI
-        result = answer_question_with_rag(
+        # (run in a worker thread so Chroma/OpenAI I/O doesn't block other requests)
+        result = await asyncio.to_thread(
+            answer_question_with_rag,
             question=request.question,
             collection_name="ingested_docs",
             n_results=5
@@ -117,6 +235,7 @@ async def query_documents(request: QueryRequest) -> QueryResponse:
         chunks = [
             {
                 "source_file": src.get("source_file"),
+                "source_files": src.get("source_files"),
                 "chunk_id": src.get("chunk_id")
             }
             for src in sources
@@ -131,6 +250,24 @@ async def query_documents(request: QueryRequest) -> QueryResponse:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
 
 
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """
+    Same as /query, but streams the answer as Server-Sent Events
+    Emits {"token": ...} events, then a final {"sources": [...]} event
+    """
+    def event_generator():
+        events = answer_question_with_rag_stream(
+            question=request.question,
+            collection_name="ingested_docs",
+            n_results=5
+        )
+        for event in events:
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
 @app.get("/documents")
 async def list_documents():
     """
@@ -139,13 +276,17 @@ async def list_documents():
     """
     try:
         raw_files = [f.name for f in DATA_RAW.glob("*") if f.is_file()]
-        processed_files = [f.name for f in DATA_PROCESSED.glob("chunks_*.json")]
+        processed_files = [f.name for f in DATA_PROCESSED.glob("chunks_*.parquet")]
         
-        # Count total chunks
-        total_chunks = 0
-        for json_file in DATA_PROCESSED.glob("chunks_*.json"):
-            with open(json_file, 'r', encoding='utf-8') as f:
-                total_chunks += len(json.load(f))
+        # Total chunks from the index written by the pipeline,
+        # or else from the Parquet footers (no rows are read)
+        index_path = DATA_PROCESSED / INDEX_FILENAME
+        if index_path.exists():
+            total_chunks = orjson.loads(index_path.read_bytes())["total_chunks"]
+        else:
+            total_chunks = sum(
+                pq.ParquetFile(f).metadata.num_rows for f in DATA_PROCESSED.glob("chunks_*.parquet")
+            )
         
         return {
             "raw_documents": raw_files,
@@ -170,6 +311,9 @@ async def delete_document(filename: str):
         
         file_path.unlink()
         
+        # Remove its chunks from the vector DB too
+        await asyncio.to_thread(remove_document, filename, output_dir=str(DATA_PROCESSED))
+        
         return {
             "status": "success",
             "message": f"Document {filename} deleted"
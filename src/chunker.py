@@ -3,9 +3,59 @@ Text Chunker
 Splits document text into smaller chunks for better processing
 """
 
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def create_chunks(parsed_doc: dict, chunk_size: int = 1000, chunk_overlap: int = 200) -> list:
+@dataclass
+class ChunkBatch:
+    """
+    Chunks stored column-wise (one list/array per field) instead of one
+    dict per chunk: less memory per chunk and vectorized stats
+    """
+    texts: List[str]
+    char_counts: np.ndarray
+    source_files: List[str]
+    page_numbers: np.ndarray
+    chunk_ids: np.ndarray
+    
+    def __len__(self):
+        return len(self.texts)
+    
+    @classmethod
+    def empty(cls) -> "ChunkBatch":
+        return cls([], np.empty(0, dtype=np.int32), [], np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+    
+    @classmethod
+    def concat(cls, batches: List["ChunkBatch"]) -> "ChunkBatch":
+        """
+        Join several batches (e.g. one per document) into one
+        """
+        if not batches:
+            return cls.empty()
+        return cls(
+            texts=[text for b in batches for text in b.texts],
+            char_counts=np.concatenate([b.char_counts for b in batches]),
+            source_files=[src for b in batches for src in b.source_files],
+            page_numbers=np.concatenate([b.page_numbers for b in batches]),
+            chunk_ids=np.concatenate([b.chunk_ids for b in batches])
+        )
+
+@lru_cache(maxsize=8)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """
+    Build a text splitter once per (chunk_size, chunk_overlap)
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]  # Try to split at natural boundaries
+    )
+
+def create_chunks(parsed_doc: dict, chunk_size: int = 1000, chunk_overlap: int = 200) -> ChunkBatch:
     """
     Split document text into chunks
     
@@ -15,55 +65,44 @@ def create_chunks(parsed_doc: dict, chunk_size: int = 1000, chunk_overlap: int =
         chunk_overlap: Number of characters to overlap between chunks
     
     Returns:
-        List of chunk dictionaries with metadata
+        ChunkBatch with the chunks and their metadata
     """
     if not parsed_doc or not parsed_doc.get('pages'):
-        return []
+        return ChunkBatch.empty()
     
-    # Initialize text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]  # Try to split at natural boundaries
-    )
+    # Reuse the text splitter for these settings
+    text_splitter = _get_splitter(chunk_size, chunk_overlap)
     
-    chunks = []
-    chunk_id = 0
+    texts = []
+    page_numbers = []
     
     # Process each page
     for page in parsed_doc['pages']:
-        page_text = page['text']
-        page_number = page['page_number']
-        
         # Split page text into chunks
-        page_chunks = text_splitter.split_text(page_text)
-        
-        # Create chunk metadata
-        for chunk_text in page_chunks:
-            chunks.append({
-                'chunk_id': chunk_id,
-                'text': chunk_text,
-                'char_count': len(chunk_text),
-                'source_file': parsed_doc['source_file'],
-                'page_number': page_number
-            })
-            chunk_id += 1
+        page_chunks = text_splitter.split_text(page['text'])
+        texts.extend(page_chunks)
+        page_numbers.extend([page['page_number']] * len(page_chunks))
     
-    return chunks
+    return ChunkBatch(
+        texts=texts,
+        char_counts=np.fromiter(map(len, texts), dtype=np.int32, count=len(texts)),
+        source_files=[parsed_doc['source_file']] * len(texts),
+        page_numbers=np.array(page_numbers, dtype=np.int32),
+        chunk_ids=np.arange(len(texts), dtype=np.int32)
+    )
 
-def get_chunking_stats(chunks: list) -> dict:
+def get_chunking_stats(chunks: ChunkBatch) -> dict:
     """
     Get statistics about the chunking process
     """
-    if not chunks:
+    if not len(chunks):
         return {'total_chunks': 0}
     
-    char_counts = [c['char_count'] for c in chunks]
+    char_counts = chunks.char_counts
     
     return {
         'total_chunks': len(chunks),
-        'avg_chunk_size': sum(char_counts) / len(char_counts),
-        'min_chunk_size': min(char_counts),
-        'max_chunk_size': max(char_counts)
+        'avg_chunk_size': float(char_counts.mean()),
+        'min_chunk_size': int(char_counts.min()),
+        'max_chunk_size': int(char_counts.max())
     }
@@ -1,38 +1,35 @@
-"""Verify the latest JSON output"""
-import json
+"""Verify the latest Parquet output"""
+import pyarrow.parquet as pq
+from collections import Counter
 from pathlib import Path
 
 print("\n" + "="*70)
 print("📊 STEP 7: VERIFYING FINAL OUTPUT")
 print("="*70)
 
-# Find the latest JSON file
+# Find the latest Parquet file
 output_dir = Path('../data/processed')
-json_files = list(output_dir.glob('*.json'))
+parquet_files = list(output_dir.glob('chunks_*.parquet'))
 
-if not json_files:
+if not parquet_files:
     print("❌ No output files found!")
     exit(1)
 
 # Get the most recent file
-latest_file = max(json_files, key=lambda p: p.stat().st_mtime)
+latest_file = max(parquet_files, key=lambda p: p.stat().st_mtime)
 
 print(f"\n✓ Found output file: {latest_file.name}")
 print(f"  File size: {latest_file.stat().st_size} bytes")
 
-# Load the JSON
-with open(latest_file, 'r', encoding='utf-8') as f:
-    chunks = json.load(f)
+# Load the Parquet file
+chunks = pq.read_table(latest_file).to_pylist()
 
-print(f"\n✓ Successfully loaded JSON")
+print(f"\n✓ Successfully loaded Parquet")
 print(f"  Total chunks: {len(chunks)}")
 
 # Show breakdown by source
 print(f"\n📄 Chunks per document:")
-sources = {}
-for chunk in chunks:
-    source = chunk['source_file']
-    sources[source] = sources.get(source, 0) + 1
+sources = Counter(chunk['source_file'] for chunk in chunks)
 
 for i, (source, count) in enumerate(sources.items(), 1):
     print(f"  {i}. {source}: {count} chunk(s)")
@@ -0,0 +1,63 @@
+"""
+Local Embedder
+Int8-quantized all-MiniLM-L6-v2 (ONNX Runtime, CPU) for embeddings without
+an OpenAI round-trip. Enabled with EMBEDDING_BACKEND=local
+"""
+
+import threading
+import numpy as np
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_FILE = "onnx/model_quint8_avx2.onnx"  # INT8 weights, 384-dim output
+MAX_LENGTH = 256
+
+_session = None
+_tokenizer = None
+_load_lock = threading.Lock()
+
+
+def load_model():
+    """
+    Download (first run only) and load the ONNX model and tokenizer
+    """
+    global _session, _tokenizer
+    if _session is None:
+        with _load_lock:
+            if _session is None:
+                # Imported here so the OpenAI backend doesn't need them loaded
+                import onnxruntime as ort
+                from huggingface_hub import hf_hub_download
+                from tokenizers import Tokenizer
+
+                tokenizer = Tokenizer.from_pretrained(MODEL_ID)
+                tokenizer.enable_truncation(max_length=MAX_LENGTH)
+                tokenizer.enable_padding()
+
+                model_path = hf_hub_download(MODEL_ID, MODEL_FILE)
+                _tokenizer = tokenizer
+                _session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    return _session, _tokenizer
+
+
+def embed(texts: list) -> list:
+    """
+    Embed texts: mean-pool the token embeddings, then L2-normalize
+    """
+    session, tokenizer = load_model()
+    encodings = tokenizer.encode_batch(texts)
+
+    input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+    attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+    inputs = {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "token_type_ids": np.zeros_like(input_ids),
+    }
+    input_names = {i.name for i in session.get_inputs()}
+    token_embeddings = session.run(None, {k: v for k, v in inputs.items() if k in input_names})[0]
+
+    # Mean pooling over real (non-padding) tokens
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.tolist()
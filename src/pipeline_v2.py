@@ -3,102 +3,499 @@ Document Ingestion Pipeline + Vector Store Integration (Enhanced)
 Combines Anurag's ingestion + Gael's ChromaDB + OpenAI RAG
 """
 
-import json
+import orjson
+import time
+import threading
+import uuid
+import xxhash
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import chromadb
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 
 from loader import load_documents
 from parser import parse_document
-from chunker import create_chunks, get_chunking_stats
+from chunker import ChunkBatch, create_chunks, get_chunking_stats
+from semantic_cache import SemanticCache, PersistentSemanticCache
+import local_embedder
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
+# Initialize OpenAI client (one shared instance: its pooled keep-alive
+# connections are reused across requests, see warm_up)
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # ChromaDB persistent storage path
 CHROMA_DB_PATH = Path(__file__).parent.parent / "chroma_db"
 
+# Optional Chroma server (see docker-compose.yml); local storage if unset
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
 
-def run_pipeline(input_dir: str = '../data/raw', output_dir: str = '../data/processed', collection_name: str = "ingested_docs"):
+# Embedding backend: "openai" (API) or "local" (int8 MiniLM, see local_embedder.py)
+# Index and queries must use the same backend: re-ingest after switching
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+# Models
+EMBEDDING_MODEL = local_embedder.MODEL_ID if EMBEDDING_BACKEND == "local" else "text-embedding-3-small"
+CHAT_MODEL = "gpt-4o-mini"
+
+# Embedding batching (OpenAI accepts many inputs per request)
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_MAX_WORKERS = 8
+EMBEDDING_MAX_RETRIES = 5
+
+# HNSW index settings for new collections (cosine matches normalized embeddings)
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64,
+}
+
+# Summary of the indexed corpus, kept in the output dir (see update_index)
+INDEX_FILENAME = "_index.json"
+_index_lock = threading.Lock()
+
+# Serializes writes to the vector store: concurrent ingestion jobs merging
+# source_files on the same shared chunk would otherwise lose updates
+_store_lock = threading.Lock()
+
+# Chunks embedded and written to Chroma per step (caps peak memory)
+CHROMA_BATCH_SIZE = 256
+
+
+@lru_cache(maxsize=4096)
+def _embed_query(text: str) -> tuple:
+    return tuple(_embed_batch([text])[0])
+
+
+def embed_query(text: str) -> list:
     """
-    Processes documents -> chunks -> embeds -> stores in ChromaDB
+    Embed a question with the configured backend
+    Results are cached, so repeated questions skip the embedding call
     """
-    print("="*60)
-    print("🚀 Starting Document Ingestion + Embedding Pipeline")
-    print("="*60)
+    return list(_embed_query(text.strip().lower()))
 
-    # STEP 1: Load files
-    print("\n[1/5] Loading documents...")
-    documents = load_documents(input_dir)
-    if not documents:
-        print("❌ No documents found.")
+
+def _embed_batch(batch: list) -> list:
+    """
+    Embed one batch of texts, retrying with exponential backoff on rate limits
+    """
+    if EMBEDDING_BACKEND == "local":
+        return local_embedder.embed(batch)
+
+    for attempt in range(EMBEDDING_MAX_RETRIES):
+        try:
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+            return [d.embedding for d in response.data]
+        except RateLimitError:
+            if attempt == EMBEDDING_MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def embed_texts(texts: list, batch_size: int = EMBEDDING_BATCH_SIZE) -> list:
+    """
+    Embed many texts in batches (parallel threads)
+    Returns embeddings in the same order as texts
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return []
+
+    # Calls are I/O-bound, so threads are enough; map() preserves order
+    with ThreadPoolExecutor(max_workers=min(EMBEDDING_MAX_WORKERS, len(batches))) as executor:
+        results = executor.map(_embed_batch, batches)
+
+    embeddings = []
+    for batch_embeddings in results:
+        embeddings.extend(batch_embeddings)
+    return embeddings
+
+
+# Caches of RAG answers, cleared whenever the corpus changes:
+# in-process (exact + semantic) first, then the persistent Chroma collection
+query_cache = SemanticCache(embed_query, max_size=1000, ttl=3600, threshold=0.95)
+persistent_query_cache = PersistentSemanticCache(
+    lambda: get_chroma_client(), collection_name="semantic_query_cache", ttl=3600, max_distance=0.05,
+    embedding_model=EMBEDDING_MODEL, max_size=1000
+)
+
+
+def get_cached_answer(question: str, cache_scope: str):
+    """
+    Look up a cached RAG answer, in-process cache first
+    """
+    generation = query_cache.generation
+    cached = query_cache.get(question, cache_scope)
+    if cached:
+        return cached
+    
+    try:
+        cached = persistent_query_cache.get(embed_query(question), cache_scope)
+    except Exception as e:
+        print(f"⚠️ Persistent cache lookup failed: {str(e)}")
         return None
+    
+    if cached:
+        query_cache.put(question, cached, cache_scope, generation)
+    return cached
 
+
+def answer_cache_generation() -> tuple:
+    """
+    Generations of both caches: capture before retrieval, pass to cache_answer
+    """
+    return query_cache.generation, persistent_query_cache.generation
+
+
+def cache_answer(question: str, cache_scope: str, result: dict, generation: tuple):
+    """
+    Store a RAG answer in both caches
+    Dropped by a cache cleared since generation (the corpus changed mid-query)
+    """
+    query_cache.put(question, result, cache_scope, generation[0])
+    try:
+        persistent_query_cache.put(embed_query(question), result, cache_scope, generation[1])
+    except Exception as e:
+        print(f"⚠️ Could not persist cached answer: {str(e)}")
+
+
+def clear_answer_cache():
+    """
+    Invalidate every cached answer (the corpus changed)
+    """
+    query_cache.clear()
+    persistent_query_cache.clear()
+
+
+def parse_documents(documents: List[Path]) -> list:
+    """
+    Parse documents in parallel worker processes (PDF parsing is CPU-bound)
+    Returns parsed docs in the same order, None for files that failed
+    """
+    if len(documents) <= 1:
+        # Not worth starting a process pool for a single file
+        return [parse_document(doc) for doc in documents]
+
+    max_workers = min(os.cpu_count() or 1, len(documents))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(parse_document, documents))
+
+
+# Shared Chroma client, created on first use
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+
+
+def get_chroma_client():
+    """
+    Connect to the Chroma server if CHROMA_HOST is set,
+    otherwise open the local persistent store
+    The client is created once and reused by every call
+    """
+    global _chroma_client
+    if _chroma_client is None:
+        with _chroma_client_lock:
+            if _chroma_client is None:
+                if CHROMA_HOST:
+                    _chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+                else:
+                    _chroma_client = chromadb.PersistentClient(path=str(CHROMA_DB_PATH))
+    return _chroma_client
+
+
+def make_chunk_id(text: str) -> str:
+    """
+    Content-addressed chunk ID (xxh64 of the chunk text)
+    Identical chunks, in the same or different documents, share one vector
+    """
+    return xxhash.xxh64(text.encode('utf-8')).hexdigest()
+
+
+def detach_source(collection, filename: str, keep_ids=frozenset()):
+    """
+    Remove a file from the sources of its chunks
+    Chunks left without any source are deleted
+    """
+    existing = collection.get(where={'source_files': {'$contains': filename}}, include=['metadatas'])
+    
+    delete_ids, update_ids, update_metadatas = [], [], []
+    for chunk_id, meta in zip(existing['ids'], existing['metadatas']):
+        if chunk_id in keep_ids:
+            continue
+        sources = [src for src in meta['source_files'] if src != filename]
+        if sources:
+            update_ids.append(chunk_id)
+            update_metadatas.append({**meta, 'source_file': sources[0], 'source_files': sources})
+        else:
+            delete_ids.append(chunk_id)
+    
+    if delete_ids:
+        collection.delete(ids=delete_ids)
+    if update_ids:
+        collection.update(ids=update_ids, metadatas=update_metadatas)
+
+
+def read_indexed_files(output_dir: str) -> List[str]:
+    """
+    Files listed in the corpus summary (empty if nothing was ingested yet)
+    """
+    index_path = Path(output_dir) / INDEX_FILENAME
+    with _index_lock:
+        if not index_path.exists():
+            return []
+        return orjson.loads(index_path.read_bytes()).get("files", [])
+
+
+def update_index(collection, output_dir: str, added=(), removed=()):
+    """
+    Rewrite the corpus summary: total chunk count and ingested files
+    Lets /documents answer without reading every chunks file
+    """
+    index_path = Path(output_dir) / INDEX_FILENAME
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with _index_lock:
+        files = set()
+        if index_path.exists():
+            files = set(orjson.loads(index_path.read_bytes()).get("files", []))
+        files = (files | set(added)) - set(removed)
+        
+        index = {"total_chunks": collection.count(), "files": sorted(files)}
+        tmp_path = index_path.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps(index, option=orjson.OPT_INDENT_2))
+        tmp_path.replace(index_path)
+
+
+def chunk_documents(documents: List[Path], output_dir: str = '../data/processed') -> ChunkBatch:
+    """
+    CPU stage of the pipeline: parse -> chunk -> save chunks as Parquet
+    No network or vector DB access, safe to run in a worker thread
+    """
     # STEP 2: Parse & chunk
     print("\n[2/5] Parsing & chunking documents...")
-    all_chunks = []
-    for doc in documents:
-        parsed = parse_document(doc)
+    batches = []
+    parsed_docs = parse_documents(documents)
+    for doc, parsed in zip(documents, parsed_docs):
         if not parsed:
             continue
         chunks = create_chunks(parsed)
-        all_chunks.extend(chunks)
+        batches.append(chunks)
         print(f"  ✓ {doc.name}: {len(chunks)} chunks")
+    all_chunks = ChunkBatch.concat(batches)
 
     stats = get_chunking_stats(all_chunks)
     print(f"\nChunking complete → {stats['total_chunks']} chunks total")
 
-    # STEP 3: Save as JSON
+    # STEP 3: Save as Parquet (columnar + compressed, row count in the footer)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = output_path / f"chunks_{timestamp}.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2, ensure_ascii=False)
+    # Microseconds + a random suffix: concurrent uploads must not share a file
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    output_file = output_path / f"chunks_{timestamp}_{uuid.uuid4().hex[:8]}.parquet"
+    table = pa.table({
+        'chunk_id': all_chunks.chunk_ids,
+        'text': pa.array(all_chunks.texts, type=pa.string()),
+        'char_count': all_chunks.char_counts,
+        'source_file': pa.array(all_chunks.source_files, type=pa.string()),
+        'page_number': all_chunks.page_numbers
+    })
+    pq.write_table(table, output_file, compression='snappy')
     print(f"✓ Saved chunks to {output_file}")
 
+    return all_chunks
+
+
+def store_chunks(all_chunks: ChunkBatch, documents: List[Path], output_dir: str = '../data/processed',
+                 collection_name: str = "ingested_docs", removed_files=()):
+    """
+    I/O stage of the pipeline: embed -> store chunks of documents in ChromaDB
+    Chunks previously stored for these documents but not in all_chunks are dropped,
+    as are the chunks of removed_files (files no longer in the corpus)
+    Holds the store lock, so one ingestion writes to the collection at a time
+    """
+    with _store_lock:
+        return _store_chunks(all_chunks, documents, output_dir, collection_name, removed_files)
+
+
+def _store_chunks(all_chunks: ChunkBatch, documents: List[Path], output_dir: str, collection_name: str,
+                  removed_files=()):
+    ingested_files = set(all_chunks.source_files)
+
     # STEP 4: Create Chroma collection with persistence
     print("\n[4/5] Creating ChromaDB collection...")
-    chroma_client = chromadb.PersistentClient(path=str(CHROMA_DB_PATH))
-    
-    # Delete existing collection if it exists (for fresh ingestion)
-    try:
-        chroma_client.delete_collection(collection_name)
-        print(f"  ✓ Cleared existing collection: {collection_name}")
-    except:
-        pass
-    
-    collection = chroma_client.create_collection(collection_name)
+    collection = open_collection(collection_name)
+    mismatch = check_embedding_model(collection)
+    if mismatch:
+        raise ValueError(mismatch)
     print(f"✓ Using collection: {collection_name}")
 
+    # Same text in several chunks/files shares an ID: keep the first chunk
+    # (its row in all_chunks), list every source
+    unique_rows = {}
+    unique_sources = {}
+    for row, (text, source_file) in enumerate(zip(all_chunks.texts, all_chunks.source_files)):
+        chunk_id = make_chunk_id(text)
+        if chunk_id not in unique_rows:
+            unique_rows[chunk_id] = row
+            unique_sources[chunk_id] = []
+        if source_file not in unique_sources[chunk_id]:
+            unique_sources[chunk_id].append(source_file)
+    ids = list(unique_rows)
+    rows = list(unique_rows.values())
+
+    # Detach re-ingested files from chunks they no longer contain
+    for doc in documents:
+        detach_source(collection, doc.name, keep_ids=unique_rows.keys())
+    for filename in removed_files:
+        detach_source(collection, filename)
+
+    empty_files = [doc.name for doc in documents if doc.name not in ingested_files]
+    empty_files += removed_files
+
+    if not ids:
+        clear_answer_cache()
+        update_index(collection, output_dir, removed=empty_files)
+        print("❌ No chunks to store.")
+        return collection
+
     # STEP 5: Embed & store chunks
     print("\n[5/5] Embedding and storing chunks...")
-    texts = [chunk['text'] for chunk in all_chunks]
-    ids = [f"{chunk['source_file']}_chunk_{chunk['chunk_id']}" for chunk in all_chunks]
+    texts = [all_chunks.texts[row] for row in rows]
+    chunk_numbers = all_chunks.chunk_ids[rows].tolist()
+    page_numbers = all_chunks.page_numbers[rows].tolist()
     metadatas = [
         {
-            'source_file': chunk['source_file'],
-            'chunk_id': chunk['chunk_id'],
-            'page_number': chunk['page_number']
+            'source_file': unique_sources[chunk_id][0],
+            'source_files': unique_sources[chunk_id],
+            'chunk_id': chunk_number,
+            'page_number': page_number
         }
-        for chunk in all_chunks
+        for chunk_id, chunk_number, page_number in zip(ids, chunk_numbers, page_numbers)
     ]
 
-    # Store in Chroma with metadata
-    collection.add(
-        documents=texts,
-        ids=ids,
-        metadatas=metadatas
-    )
+    # Embed & store in Chroma batch by batch, so only one batch of
+    # embeddings is held in memory at a time
+    new_count = 0
+    for i in range(0, len(texts), CHROMA_BATCH_SIZE):
+        batch_ids = ids[i:i + CHROMA_BATCH_SIZE]
+        existing = collection.get(ids=batch_ids, include=['metadatas'])
+        existing_metadatas = dict(zip(existing['ids'], existing['metadatas']))
+        
+        # Chunks already in the collection: only merge their sources, no re-embedding
+        update_ids, update_metadatas = [], []
+        new_positions = []
+        for pos in range(i, i + len(batch_ids)):
+            old_meta = existing_metadatas.get(ids[pos])
+            if old_meta is None:
+                new_positions.append(pos)
+                continue
+            sources = list(old_meta.get('source_files') or [])
+            sources += [src for src in metadatas[pos]['source_files'] if src not in sources]
+            if sources != old_meta.get('source_files'):
+                update_ids.append(ids[pos])
+                update_metadatas.append({**old_meta, 'source_file': sources[0], 'source_files': sources})
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metadatas)
+        
+        if new_positions:
+            embeddings = embed_texts([texts[pos] for pos in new_positions])
+            collection.upsert(
+                documents=[texts[pos] for pos in new_positions],
+                embeddings=embeddings,
+                ids=[ids[pos] for pos in new_positions],
+                metadatas=[metadatas[pos] for pos in new_positions]
+            )
+            new_count += len(new_positions)
+        print(f"  ✓ Embedded & stored {min(i + CHROMA_BATCH_SIZE, len(texts))}/{len(texts)} chunks")
+
+    print(f"  ✓ {new_count} new embeddings, {len(texts) - new_count} chunks already stored")
+
+    # Corpus changed, cached answers may be stale
+    clear_answer_cache()
+    update_index(collection, output_dir, added=ingested_files, removed=empty_files)
 
     print(f"✅ Stored {len(texts)} chunks in Chroma collection: '{collection_name}'")
-    print(f"✅ ChromaDB persisted at: {CHROMA_DB_PATH}")
+    if CHROMA_HOST:
+        print(f"✅ ChromaDB server: {CHROMA_HOST}:{CHROMA_PORT}")
+    else:
+        print(f"✅ ChromaDB persisted at: {CHROMA_DB_PATH}")
+
+    return collection
+
+
+def open_collection(collection_name: str = "ingested_docs"):
+    """
+    Get or create a collection, tagged with the embedding model
+    and the HNSW settings (only applied when it is created)
+    """
+    # Embeddings are supplied explicitly, so no Chroma embedder
+    return get_chroma_client().get_or_create_collection(
+        collection_name,
+        metadata={**HNSW_METADATA, "embedding_model": EMBEDDING_MODEL},
+        embedding_function=None
+    )
+
+
+def rebuild_legacy_collection(collection_name: str = "ingested_docs", output_dir: str = '../data/processed') -> bool:
+    """
+    Recreate a collection built before collections were tagged with their
+    embedding model (Chroma's default 384-dim embedder, L2 space, no
+    source_files): it can't be queried with the current embedder
+    Returns True if it was recreated, every document must then be re-ingested
+    """
+    with _store_lock:
+        collection = get_collection(collection_name)
+        if collection is None or (collection.metadata or {}).get("embedding_model"):
+            return False
+        
+        print(f"⚠️ Collection '{collection_name}' has no embedding model tag, rebuilding it")
+        get_chroma_client().delete_collection(collection_name)
+        clear_answer_cache()
+        collection = open_collection(collection_name)
+        update_index(collection, output_dir, removed=read_indexed_files(output_dir))
+        return True
+
+
+def run_pipeline(input_dir: str = '../data/raw', output_dir: str = '../data/processed',
+                 collection_name: str = "ingested_docs", files: Optional[List[Path]] = None):
+    """
+    Processes documents -> chunks -> embeds -> stores in ChromaDB
+    If files is given, only those are (re)ingested; everything else in the
+    collection is left untouched. Otherwise files no longer in input_dir are
+    removed from the collection
+    """
+    print("="*60)
+    print("🚀 Starting Document Ingestion + Embedding Pipeline")
+    print("="*60)
+
+    # STEP 1: Load files
+    print("\n[1/5] Loading documents...")
+    documents = [Path(f) for f in files] if files else load_documents(input_dir)
+    if rebuild_legacy_collection(collection_name, output_dir) and files:
+        # Collection was emptied: ingest everything, not just the given files
+        documents = load_documents(input_dir)
+
+    removed_files = []
+    if not files:
+        present = {doc.name for doc in documents}
+        removed_files = [name for name in read_indexed_files(output_dir) if name not in present]
+    if not documents and not removed_files:
+        print("❌ No documents found.")
+        return None
+
+    all_chunks = chunk_documents(documents, output_dir) if documents else ChunkBatch.empty()
+    collection = store_chunks(all_chunks, documents, output_dir, collection_name, removed_files)
+
     print("="*60)
     print("Pipeline complete! Ready for querying.")
     print("="*60)
@@ -106,13 +503,57 @@ def run_pipeline(input_dir: str = '../data/raw', output_dir: str = '../data/proc
     return collection
 
 
+def remove_document(filename: str, collection_name: str = "ingested_docs", output_dir: str = '../data/processed'):
+    """
+    Remove every chunk of a document from the collection
+    """
+    with _store_lock:
+        collection = get_collection(collection_name)
+        if collection:
+            detach_source(collection, filename)
+            clear_answer_cache()
+            update_index(collection, output_dir, removed=[filename])
+
+
+def check_embedding_model(collection):
+    """
+    Returns an error message if the collection was embedded with another model
+    (or an unknown one: untagged collections predate the tag)
+    """
+    model = (collection.metadata or {}).get("embedding_model")
+    if not model:
+        return (f"Collection '{collection.name}' has no embedding model tag (built by an older version). "
+                f"Upload a document or run the pipeline to rebuild it.")
+    if model != EMBEDDING_MODEL:
+        return (f"Collection '{collection.name}' was embedded with {model}, but "
+                f"EMBEDDING_BACKEND uses {EMBEDDING_MODEL}. Delete the collection and re-ingest after switching backends.")
+    return None
+
+
+def warm_up(collection_name: str = "ingested_docs"):
+    """
+    Pay cold-start costs before the first real query: open the Chroma
+    client and collection, page the HNSW index into memory, and open the
+    OpenAI connection (or load the local embedding model)
+    Failures are logged, never raised
+    """
+    try:
+        collection = get_collection(collection_name)
+        vec = embed_query("warmup")
+        if collection and collection.count() and not check_embedding_model(collection):
+            collection.query(query_embeddings=[vec], n_results=1)
+        print("✓ Warm-up complete")
+    except Exception as e:
+        print(f"⚠️ Warm-up failed: {str(e)}")
+
+
 def get_collection(collection_name: str = "ingested_docs"):
     """
     Get existing ChromaDB collection
     """
-    chroma_client = chromadb.PersistentClient(path=str(CHROMA_DB_PATH))
+    chroma_client = get_chroma_client()
     try:
-        return chroma_client.get_collection(collection_name)
+        return chroma_client.get_collection(collection_name, embedding_function=None)
     except:
         return None
 
@@ -121,21 +562,26 @@ def query_collection(collection, query: str, n_results: int = 3):
     """
     Query the Chroma collection for relevant chunks
     """
-    results = collection.query(query_texts=[query], n_results=n_results)
+    results = collection.query(query_embeddings=[embed_query(query)], n_results=n_results)
     return results
 
 
-def answer_question_with_rag(question: str, collection_name: str = "ingested_docs", n_results: int = 3):
+def build_rag_prompt(question: str, collection_name: str = "ingested_docs", n_results: int = 3):
     """
-    Runs a RAG query: retrieve → send to OpenAI → get final answer
+    Retrieve relevant chunks and build the prompt for OpenAI
+    Returns (prompt, sources), or an error message string
     """
     # Get collection
     collection = get_collection(collection_name)
     if not collection:
         return "No documents have been indexed yet. Please run the ingestion pipeline first."
     
+    mismatch = check_embedding_model(collection)
+    if mismatch:
+        return mismatch
+    
     # Retrieve relevant chunks
-    results = collection.query(query_texts=[question], n_results=n_results)
+    results = collection.query(query_embeddings=[embed_query(question)], n_results=n_results)
     
     if not results["documents"] or not results["documents"][0]:
         return "No relevant information found for your query."
@@ -146,25 +592,52 @@ def answer_question_with_rag(question: str, collection_name: str = "ingested_doc
     # Build context
     context = "\n\n---\n\n".join(retrieved_chunks)
 
-    # Create prompt
-    prompt = f"""You are an assistant that answers questions based on retrieved document context.
+    # Create prompt (single join, no intermediate copies of the context)
+    prompt = "".join([
+        "You are an assistant that answers questions based on retrieved document context.\n\n",
+        "Context from documents:\n",
+        context,
+        "\n\nQuestion: ",
+        question,
+        "\n\nInstructions:\n",
+        "- Answer ONLY based on the context provided above\n",
+        "- Be concise and direct\n",
+        "- If the context doesn't contain enough information, say so\n",
+        "- Cite specific details from the context when relevant\n",
+    ])
+
+    sources = [
+        {
+            "source_file": meta.get("source_file"),
+            "source_files": meta.get("source_files", [meta.get("source_file")]),
+            "chunk_id": meta.get("chunk_id")
+        }
+        for meta in metadatas
+    ]
+    return prompt, sources
 
-Context from documents:
-{context}
 
-Question: {question}
+def answer_question_with_rag(question: str, collection_name: str = "ingested_docs", n_results: int = 3):
+    """
+    Runs a RAG query: retrieve → send to OpenAI → get final answer
+    Repeated or near-identical questions are served from the answer caches
+    """
+    # Check cache first (skips Chroma and OpenAI on hit)
+    cache_scope = f"{collection_name}|{n_results}|{CHAT_MODEL}"
+    generation = answer_cache_generation()
+    cached = get_cached_answer(question, cache_scope)
+    if cached:
+        return cached
 
-Instructions:
-- Answer ONLY based on the context provided above
-- Be concise and direct
-- If the context doesn't contain enough information, say so
-- Cite specific details from the context when relevant
-"""
+    rag_prompt = build_rag_prompt(question, collection_name, n_results)
+    if isinstance(rag_prompt, str):
+        return rag_prompt
+    prompt, sources = rag_prompt
 
     # Get GPT answer
     try:
         response = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=CHAT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3
         )
@@ -172,20 +645,69 @@ Instructions:
         answer = response.choices[0].message.content
         
         # Return answer with metadata
-        return {
+        result = {
             "answer": answer,
-            "sources": [
-                {
-                    "source_file": meta.get("source_file"),
-                    "chunk_id": meta.get("chunk_id")
-                }
-                for meta in metadatas
-            ]
+            "sources": sources
         }
+        cache_answer(question, cache_scope, result, generation)
+        return result
     except Exception as e:
         return f"Error generating answer: {str(e)}"
 
 
+def answer_question_with_rag_stream(question: str, collection_name: str = "ingested_docs", n_results: int = 3):
+    """
+    Streaming version of answer_question_with_rag
+    Yields {"token": ...} events as OpenAI generates them, then a final
+    {"sources": [...]} event, or a single {"error": ...} event
+    """
+    cache_scope = f"{collection_name}|{n_results}|{CHAT_MODEL}"
+    generation = answer_cache_generation()
+    # Headers are already sent once streaming starts: report failures
+    # (embedding, Chroma) as an event, never as an exception
+    try:
+        cached = get_cached_answer(question, cache_scope)
+        if not cached:
+            rag_prompt = build_rag_prompt(question, collection_name, n_results)
+    except Exception as e:
+        yield {"error": f"Query failed: {str(e)}"}
+        return
+
+    if cached:
+        yield {"token": cached["answer"]}
+        yield {"sources": cached["sources"]}
+        return
+
+    if isinstance(rag_prompt, str):
+        yield {"error": rag_prompt}
+        return
+    prompt, sources = rag_prompt
+
+    try:
+        stream = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            stream=True
+        )
+        
+        # Collect deltas in a list and join once at the end
+        parts: list[str] = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield {"token": delta}
+        
+        answer = "".join(parts)
+        cache_answer(question, cache_scope, {"answer": answer, "sources": sources}, generation)
+        yield {"sources": sources}
+    except Exception as e:
+        yield {"error": f"Error generating answer: {str(e)}"}
+
+
 if __name__ == "__main__":
     # Run pipeline
     collection = run_pipeline()
@@ -0,0 +1,307 @@
+"""
+Semantic Query Cache
+In-process cache for RAG answers (exact-match LRU + embedding similarity),
+plus a persistent tier stored in a Chroma collection
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+import orjson
+from chromadb.errors import NotFoundError
+
+
+class SemanticCache:
+    """
+    Caches RAG results so repeated questions skip Chroma and OpenAI
+
+    Tier 1: exact match on sha256(question|scope), LRU ordered
+    Tier 2: cosine similarity between the question embedding and the
+            embeddings of previously answered questions in the same scope
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], max_size: int = 1000,
+                 ttl: float = 3600, threshold: float = 0.95):
+        """
+        Args:
+            embed_fn: Returns the embedding vector for a piece of text
+            max_size: Maximum number of cached answers (LRU eviction)
+            ttl: Seconds before a cached answer expires
+            threshold: Minimum cosine similarity for a semantic hit
+        """
+        self.embed_fn = embed_fn
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.clear()
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped by clear(): capture it before computing a result, pass it to put()
+        """
+        return self._generation
+
+    def clear(self):
+        """
+        Drop every cached answer (call when the corpus changes)
+        """
+        with self._lock:
+            self._generation += 1
+            # key -> slot index in the embedding matrix, in LRU order
+            self._entries = OrderedDict()
+            # Contiguous (max_size, dim) matrix, allocated on first put
+            self._embeddings = None
+            self._valid = np.zeros(self.max_size, dtype=bool)
+            self._payloads = [None] * self.max_size
+            self._scopes = [None] * self.max_size
+            self._timestamps = np.zeros(self.max_size, dtype=np.float64)
+            self._free_slots = list(range(self.max_size - 1, -1, -1))
+            # Embeddings computed by get() on a miss, reused by put()
+            self._pending = OrderedDict()
+
+    @staticmethod
+    def make_key(question: str, scope: str = "") -> str:
+        """
+        Exact-match key for a question within a scope
+        """
+        return hashlib.sha256(f"{question}|{scope}".encode("utf-8")).hexdigest()
+
+    def _normalize(self, vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _is_expired(self, slot: int, now: float) -> bool:
+        return now - self._timestamps[slot] > self.ttl
+
+    def _evict(self, key: str):
+        slot = self._entries.pop(key)
+        self._valid[slot] = False
+        self._payloads[slot] = None
+        self._scopes[slot] = None
+        self._free_slots.append(slot)
+
+    def get(self, question: str, scope: str = "") -> Optional[dict]:
+        """
+        Look up a cached result for a question
+
+        Args:
+            question: User question
+            scope: Extra key parts (collection, n_results, model)
+
+        Returns:
+            Cached result dict, or None on miss
+        """
+        key = self.make_key(question, scope)
+        now = time.time()
+
+        # Tier 1: exact match
+        with self._lock:
+            slot = self._entries.get(key)
+            if slot is not None:
+                if not self._is_expired(slot, now):
+                    self._entries.move_to_end(key)
+                    return self._payloads[slot]
+                self._evict(key)
+
+        # Tier 2: semantic match (embedding computed outside the lock)
+        query_vec = self._normalize(self.embed_fn(question))
+
+        with self._lock:
+            self._pending[key] = query_vec
+            while len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+
+            if self._embeddings is None or not self._valid.any():
+                return None
+
+            mask = self._valid & (now - self._timestamps <= self.ttl)
+            mask &= np.array([s == scope for s in self._scopes], dtype=bool)
+            if not mask.any():
+                return None
+
+            sims = self._embeddings @ query_vec
+            sims[~mask] = -np.inf
+            idx = int(sims.argmax())
+            if sims[idx] >= self.threshold:
+                return self._payloads[idx]
+
+        return None
+
+    def put(self, question: str, result: dict, scope: str = "", generation: Optional[int] = None):
+        """
+        Store a result for a question
+        If generation is given and the cache was cleared since, the result
+        was computed from a stale corpus and is dropped
+        """
+        key = self.make_key(question, scope)
+
+        with self._lock:
+            query_vec = self._pending.pop(key, None)
+        if query_vec is None:
+            query_vec = self._normalize(self.embed_fn(question))
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._evict(key)
+            if not self._free_slots:
+                oldest_key = next(iter(self._entries))
+                self._evict(oldest_key)
+
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_size, query_vec.shape[0]), dtype=np.float32)
+
+            slot = self._free_slots.pop()
+            self._embeddings[slot] = query_vec
+            self._valid[slot] = True
+            self._payloads[slot] = result
+            self._scopes[slot] = scope
+            self._timestamps[slot] = time.time()
+            self._entries[key] = slot
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PersistentSemanticCache:
+    """
+    Semantic cache stored in its own Chroma collection (HNSW, cosine)
+    Survives process restarts; looked up by question embedding
+    """
+
+    def __init__(self, get_client: Callable, collection_name: str = "semantic_query_cache",
+                 ttl: float = 3600, max_distance: float = 0.05, embedding_model: str = "",
+                 max_size: int = 1000):
+        """
+        Args:
+            get_client: Returns the Chroma client to store the cache in
+            collection_name: Chroma collection holding cached answers
+            ttl: Seconds before a cached answer expires
+            max_distance: Maximum cosine distance for a hit
+            embedding_model: Model of the question embeddings; a cache
+                collection tagged with another (or no) model is dropped
+            max_size: Maximum number of cached answers (oldest evicted first)
+        """
+        self.get_client = get_client
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.embedding_model = embedding_model
+        self.max_size = max_size
+        self._collection = None
+        # Reentrant: put() holds it while opening the collection
+        self._lock = threading.RLock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped by clear(): capture it before computing a result, pass it to put()
+        """
+        return self._generation
+
+    def _get_collection(self):
+        with self._lock:
+            if self._collection is None:
+                client = self.get_client()
+                metadata = {"hnsw:space": "cosine", "embedding_model": self.embedding_model}
+                collection = client.get_or_create_collection(
+                    self.collection_name, metadata=metadata, embedding_function=None
+                )
+                if (collection.metadata or {}).get("embedding_model") != self.embedding_model:
+                    # Embedded with another model: unusable, and only a cache
+                    client.delete_collection(self.collection_name)
+                    collection = client.create_collection(
+                        self.collection_name, metadata=metadata, embedding_function=None
+                    )
+                self._collection = collection
+            return self._collection
+
+    def _run(self, operation: Callable):
+        """
+        Run operation(collection), reopening the collection once if it was
+        deleted behind our handle (clear() here or in another process)
+        """
+        collection = self._get_collection()
+        try:
+            return operation(collection)
+        except NotFoundError:
+            with self._lock:
+                if self._collection is collection:
+                    self._collection = None
+            return operation(self._get_collection())
+
+    def get(self, embedding: List[float], scope: str = "") -> Optional[dict]:
+        """
+        Returns the cached result closest to the embedding, or None on miss
+        """
+        return self._run(lambda collection: self._lookup(collection, embedding, scope))
+
+    def _lookup(self, collection, embedding: List[float], scope: str) -> Optional[dict]:
+        hit = collection.query(
+            query_embeddings=[embedding],
+            n_results=1,
+            where={"scope": scope},
+            include=["documents", "metadatas", "distances"]
+        )
+        if not hit["ids"] or not hit["ids"][0]:
+            return None
+
+        distance = hit["distances"][0][0]
+        metadata = hit["metadatas"][0][0]
+        if distance >= self.max_distance:
+            return None
+        if time.time() - metadata["ts"] > self.ttl:
+            collection.delete(ids=[hit["ids"][0][0]])
+            return None
+        return orjson.loads(hit["documents"][0][0])
+
+    def put(self, embedding: List[float], result: dict, scope: str = "", generation: Optional[int] = None):
+        """
+        Store a result under the question embedding
+        Dropped if generation is given and the cache was cleared since
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._run(lambda collection: self._insert(collection, embedding, result, scope))
+
+    def _insert(self, collection, embedding: List[float], result: dict, scope: str):
+        now = time.time()
+        collection.add(
+            ids=[uuid.uuid4().hex],
+            embeddings=[embedding],
+            documents=[orjson.dumps(result).decode()],
+            metadatas=[{"ts": now, "scope": scope}]
+        )
+
+        # Expired entries are otherwise only deleted when they are the nearest hit
+        collection.delete(where={"ts": {"$lt": now - self.ttl}})
+        excess = collection.count() - self.max_size
+        if excess > 0:
+            entries = collection.get(include=["metadatas"])
+            by_age = sorted(zip(entries["ids"], entries["metadatas"]), key=lambda e: e[1]["ts"])
+            collection.delete(ids=[entry_id for entry_id, _ in by_age[:excess]])
+
+    def clear(self):
+        """
+        Drop every cached answer (call when the corpus changes)
+        """
+        with self._lock:
+            self._generation += 1
+            # Delete first: a handle opened meanwhile would point at the old collection
+            try:
+                self.get_client().delete_collection(self.collection_name)
+            except Exception:
+                pass
+            self._collection = None
@@ -1,32 +1,34 @@
 """
-Verify the final JSON output
+Verify the final Parquet output
 """
-import json
+import pyarrow.parquet as pq
+from pathlib import Path
+from collections import Counter
+import numpy as np
 
 print("="*60)
-print("VERIFYING FINAL JSON OUTPUT")
+print("VERIFYING FINAL PARQUET OUTPUT")
 print("="*60)
 
-# Load the JSON file
-with open('../data/processed/chunks_20251030_235918.json', 'r', encoding='utf-8') as f:
-    chunks = json.load(f)
+# Load the latest Parquet file
+latest_file = max(Path('../data/processed').glob('chunks_*.parquet'), key=lambda p: p.stat().st_mtime)
+chunks = pq.read_table(latest_file).to_pylist()
 
-print(f"\n✓ Successfully loaded JSON file")
+print(f"\n✓ Successfully loaded Parquet file: {latest_file.name}")
 print(f"  Total chunks: {len(chunks)}")
 
 # Check sources
-sources = set([c['source_file'] for c in chunks])
+sources = Counter(c['source_file'] for c in chunks)
 print(f"\n✓ Documents processed:")
-for source in sources:
-    count = sum(1 for c in chunks if c['source_file'] == source)
+for source, count in sources.items():
     print(f"  - {source}: {count} chunks")
 
 # Check chunk sizes
-char_counts = [c['char_count'] for c in chunks]
+char_counts = np.fromiter((c['char_count'] for c in chunks), dtype=np.int32, count=len(chunks))
 print(f"\n✓ Chunk size statistics:")
-print(f"  Average: {sum(char_counts)/len(char_counts):.0f} characters")
-print(f"  Minimum: {min(char_counts)} characters")
-print(f"  Maximum: {max(char_counts)} characters")
+print(f"  Average: {char_counts.mean():.0f} characters")
+print(f"  Minimum: {char_counts.min()} characters")
+print(f"  Maximum: {char_counts.max()} characters")
 
 # Verify structure
 print(f"\n✓ Verifying chunk structure:")
@@ -49,5 +51,5 @@ print(f"  char_count: {chunks[0]['char_count']}")
 print(f"  text preview: {chunks[0]['text'][:80]}...")
 
 print("\n" + "="*60)
-print("JSON OUTPUT VERIFIED! ✓")
+print("PARQUET OUTPUT VERIFIED! ✓")
 print("="*60)